@@ -0,0 +1,81 @@
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pandas as pd
+import requests
+from requests_cache.backends.base import BaseCache
+
+from weather_app import utils
+
+DELAY = 0.5  # seconds taken by the test server to respond
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(DELAY)
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_concurrent_requests_are_not_serialized(monkeypatch):
+    # Use an in-memory cache rather than creating an SQLite file
+    monkeypatch.setattr(utils, "CACHE", BaseCache())
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    def fetch(path):
+        url = f"http://127.0.0.1:{server.server_port}/{path}"
+        utils.get_session().get(url, timeout=utils.TIMEOUT)
+
+    threads = [Thread(target=fetch, args=(path,)) for path in range(3)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+
+    assert elapsed < 2 * DELAY  # would take 3 * DELAY if serialized
+
+
+def test_temperature_time_series_without_forecasts():
+    temp_data = utils.get_temperature_time_series([], "Africa/Nairobi")
+
+    assert temp_data.empty
+    assert str(temp_data.index.tz) == "Africa/Nairobi"
+
+
+def test_external_IP_address_falls_back_on_errors(monkeypatch):
+    class UnreachableSession:
+        def get(self, url, **kwargs):
+            raise requests.ConnectionError(url)
+
+    monkeypatch.setattr(utils, "get_session", UnreachableSession)
+
+    assert utils.get_external_IP_address() == ""
+
+
+def test_plot_forecast_fills_in_graph_data():
+    index = pd.date_range(
+        "2021-07-10",
+        periods=36,
+        freq=pd.Timedelta(hours=1),
+        tz="Africa/Nairobi",
+    )
+    temp_data = pd.Series([float(hour % 24) for hour in range(36)], index)
+
+    temp24H_graph, temp10D_graph = utils.plot_forecast(temp_data)
+
+    assert "__" not in temp24H_graph + temp10D_graph
+    assert '"x":["2021-07-10T00:00","2021-07-10T01:00",' in temp24H_graph
+    assert '"y":[0.0,1.0,2.0,' in temp24H_graph
+    assert '"x":["2021-07-10","2021-07-11"]' in temp10D_graph
+    assert '"y":[23.0,11.0]' in temp10D_graph  # daily maxima
+    assert '"y":[0.0,0.0]' in temp10D_graph  # daily minima
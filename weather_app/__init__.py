@@ -1,18 +1,40 @@
 import os
+from threading import Thread
 from flask import Flask, request, render_template
-from weather_app.utils import process_weather_forecast, get_external_IP_address
+from flask_compress import Compress
+from weather_app.utils import process_weather_forecast, warm_up_connections
 
 app = Flask(__name__)
+# Compress responses, mostly for the sake of the embedded graph data
+app.config["COMPRESS_ALGORITHM"] = ["br", "gzip"]
+app.config["COMPRESS_MIN_SIZE"] = 2048
+Compress(app)
 DEPLOY = os.environ.get("DEPLOY")
 
 
+@app.before_first_request
+def start_warm_up():
+    """Connect to the upstream APIs in the background, so that connections
+    to the later hosts are set up while the first request is still waiting
+    on its earlier API calls.
+
+    This runs when the app starts serving rather than at import time, so that
+    merely importing the package doesn't touch the cache or the network.
+    """
+    Thread(
+        target=warm_up_connections,
+        kwargs={"external_IP_lookup": DEPLOY != "heroku"},
+        daemon=True,
+    ).start()
+
+
 @app.route("/")
 def main():
     if DEPLOY == "heroku":  # env variable set when deploying to heroku
         ip_address = request.headers["X-Forwarded-For"]
     else:  # `DEPLOY` is unset when running locally
-        # Get an IP other than 'localhost' or '127.0.0.1'
-        ip_address = get_external_IP_address()
+        # Look up an IP other than 'localhost' or '127.0.0.1'
+        ip_address = None
 
     return render_template(
         "index.html", weather_info=process_weather_forecast(ip_address)
@@ -1,51 +1,113 @@
-from io import StringIO
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import Lock, local
 
+import orjson
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
+import pytz
 import requests
 import requests_cache
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from requests_cache.backends.sqlite import DbCache
 
 # requests_cache configuration
 FLUSH_PERIOD = 10 * 60  # 10 minutes in seconds
-requests_cache.install_cache(expire_after=FLUSH_PERIOD)
 
-
-def process_weather_forecast(ip_address):
+# (connect, read) timeouts in seconds for upstream API calls, so that a slow
+# host can't tie up a worker indefinitely
+TIMEOUT = (3.05, 5)
+
+PLOTLY_JS = "https://cdn.plot.ly/plotly-basic-1.58.2.min.js"
+# Graph templates hold a placeholder in place of each data array, which is
+# rendered as e.g. ["__TIME__"]; the pattern matches these, capturing names
+PLACEHOLDER_FORMAT = "__{}__"
+PLACEHOLDER_PATTERN = re.compile(
+    r'\["' + PLACEHOLDER_FORMAT.format(r"(\w+)") + r'"\]'
+)
+
+# Each thread gets its own session (see `create_session`), but they all share
+# one response cache, created by `get_cache`, and one pool of connections
+SESSIONS = local()
+CACHE = None
+CACHE_LOCK = Lock()
+ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+
+# Current weather metrics to display: (label, API field, unit)
+CURRENT_WEATHER_FIELDS = (
+    ("Air pressure", "air_pressure_at_sea_level", "hPa"),
+    ("Air temperature", "air_temperature", "°C"),
+    ("Cloud area fraction", "cloud_area_fraction", "%"),
+    ("Relative humidity", "relative_humidity", "%"),
+    ("Wind direction (from)", "wind_from_direction", "°"),
+    ("Wind speed", "wind_speed", "m/s"),
+)
+
+# Background workers for warming up connections while other calls run
+EXECUTOR = ThreadPoolExecutor(max_workers=2)
+
+# Processed forecasts (including rendered graphs), keyed by IP address
+FORECAST_CACHE = TTLCache(maxsize=1024, ttl=FLUSH_PERIOD)
+FORECAST_CACHE_LOCK = Lock()
+
+
+def process_weather_forecast(ip_address=None):
     """Create a message with weather and location-related information.
 
     Parameters
     ----------
-    ip_address : str
-        A single IPv4/IPv6 address, or a domain name.
+    ip_address : str, optional
+        A single IPv4/IPv6 address, or a domain name. If empty, the address
+        the location lookup request came from is used. If not given, the
+        client's external IP address is looked up.
 
     Returns
     -------
     dict
         A dictionary of weather and location information.
     """
+    # The forecast request can't be sent before the location is known, but
+    # a connection to api.met.no can be opened in the meantime
+    warming_up = ip_address is None
+    if warming_up:
+        EXECUTOR.submit(warm_up_connection, "https://api.met.no/")
+        ip_address = get_external_IP_address()
+
+    with FORECAST_CACHE_LOCK:
+        forecast = FORECAST_CACHE.get(ip_address)
+    if forecast is not None:
+        return forecast
+
+    if not warming_up:
+        EXECUTOR.submit(warm_up_connection, "https://api.met.no/")
     location = get_location(ip_address)
     weather_info = get_weather_info(
         location["lat"], location["lon"], location["timezone"]
     )
-    temp_C = float(
-        weather_info["current_weather"]["Air temperature"].rstrip("°C")
-    )
-    temp_F = convert_to_fahr(temp_C)
+    temp_C = weather_info["current_temp_c"]
+    temp_F = 9 / 5 * temp_C + 32  # inlined `convert_to_fahr`
 
-    return dict(
+    forecast = dict(
         graphs=plot_forecast(weather_info["temp_time_series"]),
         headline=(
             f"It's {temp_C :.0f}°C ({temp_F :.0f}°F) in {location['city']},"
             f" {location['country']} right now."
         ),
-        ip_address=ip_address,
+        ip_address=ip_address or location["query"],
         data=weather_info,
     )
+    if ip_address:  # An empty address doesn't identify the client
+        with FORECAST_CACHE_LOCK:
+            FORECAST_CACHE[ip_address] = forecast
+
+    return forecast
 
 
 def get_location(ip_address):
     """Get city, country, latitude, longitude and timezone information for a
-    location given an IP address.
+    location given an IP address, along with the address that was looked up.
 
     Parameters
     ----------
@@ -57,14 +119,14 @@ def get_location(ip_address):
     dict
         A dictionary of location details.
     """
-    location_info = requests.get(
-        f"http://ip-api.com/json/{ip_address}",
-        headers={"User-Agent": "wqu_weather_app"},
-    ).json()
+    response = get_session().get(
+        f"http://ip-api.com/json/{ip_address}", timeout=TIMEOUT
+    )
+    location_info = orjson.loads(response.content)
 
     return {
         key: location_info[key]
-        for key in ("city", "country", "lat", "lon", "timezone")
+        for key in ("city", "country", "lat", "lon", "timezone", "query")
     }
 
 
@@ -83,16 +145,17 @@ def get_weather_info(lat, lon, timezone):
     dict
         A dictionary of various weather metrics, including icons.
     """
-    raw_data = requests.get(
+    response = get_session().get(
         "https://api.met.no/weatherapi/locationforecast/2.0/compact",
         params={"lat": lat, "lon": lon},
-        headers={"User-Agent": "wqu_weather_app"},
-    ).json()["properties"]["timeseries"]
+        timeout=TIMEOUT,
+    )
+    raw_data = orjson.loads(response.content)["properties"]["timeseries"]
+    current_details = raw_data[0]["data"]["instant"]["details"]
 
     return dict(
-        current_weather=get_current_weather(
-            raw_data[0]["data"]["instant"]["details"]
-        ),
+        current_weather=get_current_weather(current_details),
+        current_temp_c=current_details["air_temperature"],
         weather_icons=get_weather_icons(raw_data[0]["data"]),
         temp_time_series=get_temperature_time_series(raw_data, timezone),
     )
@@ -112,12 +175,8 @@ def get_current_weather(current_weather):
         Parsed weather information for the current hour.
     """
     return {
-        "Air pressure": f"{current_weather['air_pressure_at_sea_level']}hPa",
-        "Air temperature": f"{current_weather['air_temperature']}°C",
-        "Cloud area fraction": f"{current_weather['cloud_area_fraction']}%",
-        "Relative humidity": f"{current_weather['relative_humidity']}%",
-        "Wind direction (from)": f"{current_weather['wind_from_direction']}°",
-        "Wind speed": f"{current_weather['wind_speed']}m/s",
+        label: f"{current_weather[key]}{unit}"
+        for label, key, unit in CURRENT_WEATHER_FIELDS
     }
 
 
@@ -156,19 +215,44 @@ def get_temperature_time_series(weather_info, timezone):
     pandas.Series
         A pandas series of air temperature forecasts.
     """
-    time_info = [entry["time"] for entry in weather_info]
-    temp_info = [
-        entry["data"]["instant"]["details"]["air_temperature"]
-        for entry in weather_info
-    ]
-    temp_data = pd.Series(temp_info, index=time_info)
+    # Collect times and temperatures in a single pass over the forecasts
+    time_info, temp_info = [], []
+    for entry in weather_info:
+        details = entry["data"]["instant"]["details"]
+        time_info.append(entry["time"])
+        temp_info.append(details["air_temperature"])
 
     # Make the index time-zone aware
-    temp_data.index = pd.to_datetime(temp_data.index).tz_convert(timezone)
+    temp_data = pd.Series(
+        temp_info,
+        index=pd.to_datetime(time_info, utc=True).tz_convert(
+            get_tzinfo(timezone)
+        ),
+        # float32 would add rounding noise (e.g. 12.300000190734863) to the
+        # values shown in the graphs
+        dtype="float64",
+    )
 
     return temp_data
 
 
+@lru_cache(maxsize=64)
+def get_tzinfo(timezone):
+    """Get a (memoized) tzinfo object for a time zone name.
+
+    Parameters
+    ----------
+    timezone : str
+        Time zone information e.g. 'GMT'.
+
+    Returns
+    -------
+    datetime.tzinfo
+        The corresponding pytz time zone.
+    """
+    return pytz.timezone(timezone)
+
+
 def plot_forecast(temp_data):
     """Get graphs of air temperature forecasts.
 
@@ -179,54 +263,138 @@ def plot_forecast(temp_data):
 
     Returns
     -------
-    24h_forecast_graph : io.StringIO
-        A line graph of the 24hr air temperature forecast.
-    10d_forecast_graph : io.StringIO
-        A bar graph of the 10-day max & min temperature forecast.
+    24h_forecast_graph : str
+        HTML for a line graph of the 24hr air temperature forecast.
+    10d_forecast_graph : str
+        HTML for a bar graph of the 10-day max & min temperature forecast.
     """
-    temp24H = temp_data[:24]
-    fig = px.line(
-        y=temp24H, x=temp24H.index.astype(str), title="24 Hour Forecast"
+    temp24H_template, temp10D_template = get_graph_templates()
+
+    temp24H = temp_data.iloc[:24]
+    temp24H_graph = fill_graph_template(
+        temp24H_template,
+        TIME=temp24H.index.strftime("%Y-%m-%dT%H:%M").tolist(),
+        TEMP=temp24H.tolist(),
     )
-    # Rename axes labels and disable zoom
-    fig.update_xaxes(title_text="Time", fixedrange=True)
-    fig.update_yaxes(title_text="Air temperature in °C", fixedrange=True)
 
-    fig.update_layout(paper_bgcolor="azure", plot_bgcolor="azure")
-    fig.update_traces(
-        hovertemplate="<b>Time</b>: %{x}<br><b>Temp</b>: %{y}°C<br>"
+    # Daily highs and lows, each computed by a single cythonized reduction
+    temp10D = temp_data.groupby(temp_data.index.normalize())
+    temp10D_max = temp10D.max()
+    temp10D_graph = fill_graph_template(
+        temp10D_template,
+        DAY=temp10D_max.index.strftime("%Y-%m-%d").tolist(),
+        MAX=temp10D_max.tolist(),
+        MIN=temp10D.min().tolist(),
     )
-    # Write graph to text buffer
-    temp24H_graph = StringIO()
-    fig.write_html(
-        temp24H_graph,
-        full_html=False,
-        include_plotlyjs="https://cdn.plot.ly/plotly-basic-1.58.2.min.js",
+    return temp24H_graph, temp10D_graph
+
+
+@lru_cache(maxsize=None)
+def get_graph_templates():
+    """Render the forecast graphs once, with placeholders in place of their
+    data arrays.
+
+    Only the data changes between requests, so building the figures and
+    serializing them to HTML needn't be repeated each time.
+
+    Each template is stored pre-split around its placeholders, so that
+    filling it in takes a single join rather than a full copy of the HTML
+    per data array.
+
+    Returns
+    -------
+    24h_forecast_template : tuple of str
+        HTML for the 24hr forecast line graph, with `TIME` and `TEMP`
+        placeholders.
+    10d_forecast_template : tuple of str
+        HTML for the 10-day forecast bar graph, with `DAY`, `MAX` and `MIN`
+        placeholders.
+    """
+    fig = go.Figure(
+        data=[
+            go.Scatter(
+                x=[placeholder("TIME")],
+                y=[placeholder("TEMP")],
+                mode="lines",
+                hovertemplate="<b>Time</b>: %{x}<br><b>Temp</b>: %{y}°C<br>",
+            )
+        ],
+        layout=go.Layout(
+            title="24 Hour Forecast",
+            # Label axes and disable zoom
+            xaxis=dict(title="Time", fixedrange=True),
+            yaxis=dict(title="Air temperature in °C", fixedrange=True),
+            paper_bgcolor="azure",
+            plot_bgcolor="azure",
+        ),
     )
 
-    temp10D = temp_data.resample("1D").agg(["max", "min"])
-    fig2 = px.bar(
-        temp10D,
-        color_discrete_sequence=["orangered", "cyan"],
-        barmode="group",
-        title="10 Day Forecast",
+    fig2 = go.Figure(
+        data=[
+            go.Bar(
+                x=[placeholder("DAY")],
+                y=[placeholder(name.upper())],
+                name=name,
+                marker_color=color,
+                hovertemplate="<b>Date</b>: %{x}<br><b>Temp</b>: %{y}°C<br>",
+            )
+            for name, color in (("max", "orangered"), ("min", "cyan"))
+        ],
+        layout=go.Layout(
+            title="10 Day Forecast",
+            barmode="group",
+            # Label axes and disable zoom
+            xaxis=dict(title="Day", fixedrange=True),
+            yaxis=dict(title="Air temperature in °C", fixedrange=True),
+            paper_bgcolor="azure",
+            plot_bgcolor="azure",
+        ),
     )
-    # Rename axes labels and disable zoom
-    fig2.update_xaxes(title_text="Day", fixedrange=True)
-    fig2.update_yaxes(title_text="Air temperature in °C", fixedrange=True)
 
-    fig2.update_layout(paper_bgcolor="azure", plot_bgcolor="azure")
-    fig2.update_traces(
-        hovertemplate="<b>Date</b>: %{x}<br><b>Temp</b>: %{y}°C<br>"
+    # Alternating HTML segments and placeholder names
+    temp24H_template, temp10D_template = (
+        tuple(
+            PLACEHOLDER_PATTERN.split(
+                graph.to_html(
+                    full_html=False, include_plotlyjs=PLOTLY_JS, div_id=div_id
+                )
+            )
+        )
+        for graph, div_id in ((fig, "temp24H-graph"), (fig2, "temp10D-graph"))
     )
-    # Write graph to text buffer
-    temp10D_graph = StringIO()
-    fig2.write_html(
-        temp10D_graph,
-        full_html=False,
-        include_plotlyjs="https://cdn.plot.ly/plotly-basic-1.58.2.min.js",
+    # Otherwise the graphs would silently be rendered without (some) data
+    found = (temp24H_template[1::2], temp10D_template[1::2])
+    if found != (("TIME", "TEMP"), ("DAY", "MAX", "DAY", "MIN")):
+        raise RuntimeError(f"unexpected graph placeholders: {found}")
+
+    return temp24H_template, temp10D_template
+
+
+def placeholder(name):
+    """Get the marker used in graph templates for a named data array."""
+    return PLACEHOLDER_FORMAT.format(name)
+
+
+def fill_graph_template(template, **data):
+    """Insert data arrays into a graph template.
+
+    Parameters
+    ----------
+    template : tuple of str
+        A template from `get_graph_templates`.
+    **data : list
+        Values for each of the template's placeholders.
+
+    Returns
+    -------
+    str
+        HTML for the graph.
+    """
+    parts = list(template)
+    parts[1::2] = (
+        orjson.dumps(data[name]).decode() for name in template[1::2]
     )
-    return temp24H_graph, temp10D_graph
+    return "".join(parts)
 
 
 def convert_to_fahr(temp_C):
@@ -251,17 +419,116 @@ def get_external_IP_address():
     Returns
     -------
     str
-        An IPv4 or IPv6 address.
+        An IPv4 or IPv6 address, or an empty string if the service can't be
+        reached (ip-api.com then locates the address the request came from).
+    """
+    try:
+        return get_session().get("https://ident.me/", timeout=TIMEOUT).text
+    except requests.RequestException:
+        return ""
+
+
+def get_session():
+    """Get the current thread's cached HTTP session for upstream API calls,
+    creating it on first use.
+
+    Creating sessions lazily, rather than at import time, means importing
+    this module has no side effects.
+
+    Returns
+    -------
+    requests_cache.CachedSession
+        The current thread's session.
+    """
+    session = getattr(SESSIONS, "session", None)
+    if session is None:
+        session = SESSIONS.session = create_session()
+    return session
+
+
+def create_session():
+    """Create a cached HTTP session for the upstream API calls.
+
+    requests-cache holds a per-session lock for the whole of each request, so
+    a session shared between threads would serialize all upstream calls.
+    Sessions are therefore per-thread, but share the response cache and the
+    connection pools, so connections to each host are still kept alive and
+    reused instead of re-doing TCP+TLS setup for every request.
+
+    Only GET responses are cached, so HEAD requests always reach the network.
+    If refreshing an expired response fails (e.g. times out), the stale
+    response is used instead.
+
+    Returns
+    -------
+    requests_cache.CachedSession
+        A new session.
     """
-    return requests.get(
-        "https://ident.me/", headers={"User-Agent": "wqu_weather_app"}
-    ).text
+    session = requests_cache.CachedSession(
+        backend=get_cache(),
+        expire_after=FLUSH_PERIOD,
+        allowable_methods=("GET",),
+        old_data_on_error=True,
+    )
+    session.headers.update({"User-Agent": "wqu_weather_app"})
+    for prefix in ("http://", "https://"):
+        session.mount(prefix, ADAPTER)
+    return session
+
+
+def get_cache():
+    """Get the SQLite response cache shared by all sessions, creating it on
+    first use.
+
+    Returns
+    -------
+    requests_cache.backends.sqlite.DbCache
+        The response cache.
+    """
+    global CACHE
+    if CACHE is None:
+        with CACHE_LOCK:
+            if CACHE is None:
+                CACHE = DbCache("weather_cache")
+    return CACHE
+
+
+def warm_up_connection(url):
+    """Send a HEAD request to a host, leaving an open connection to it in the
+    session's pool for subsequent requests to reuse.
+
+    Parameters
+    ----------
+    url : str
+        The URL of the host to connect to.
+    """
+    try:
+        get_session().head(url, timeout=2)
+    except requests.RequestException:
+        pass  # This is only an optimization; the real request will retry
+
+
+def warm_up_connections(external_IP_lookup=True):
+    """Open connections to each of the upstream API hosts, so that the first
+    requests to them needn't wait for DNS lookups and TCP/TLS handshakes.
+
+    Parameters
+    ----------
+    external_IP_lookup : bool, default True
+        Whether to also connect to the external IP address service, which is
+        only used when running locally.
+    """
+    urls = ["http://ip-api.com/", "https://api.met.no/"]
+    if external_IP_lookup:
+        urls.append("https://ident.me/")
+
+    for url in urls:
+        warm_up_connection(url)
 
 
 if __name__ == "__main__":
     import sys
 
-    [
+    # e.g. python utils.py 8.8.8.8
+    for key, value in process_weather_forecast(sys.argv[1]).items():
         print(f"{key} --> {value}")
-        for key, value in process_weather_forecast(sys.argv[1]).items()
-    ]  # e.g. python utils.py 8.8.8.8